@@ -1,18 +1,56 @@
 import sys
 import os
+import functools
+import mmap
 import pathlib
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import traceback
+from urllib.parse import quote, urlparse
+from urllib.request import url2pathname
 import yt_dlp
 
+def _ffmpeg_cache_file():
+    """Location of the FFmpeg path cached from a previous run."""
+    return pathlib.Path.home() / '.cache' / 'mpd2mp4' / 'ffmpeg_path'
+
+def _save_ffmpeg_cache(ffmpeg_path):
+    """Remember the resolved FFmpeg path for the next run."""
+    try:
+        cache_file = _ffmpeg_cache_file()
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        cache_file.write_text(ffmpeg_path, encoding='utf-8')
+    except (OSError, RuntimeError) as e:  # RuntimeError: home directory can't be resolved
+        print(f"[Warning] Could not write FFmpeg cache: {e}")
+
+@functools.lru_cache(maxsize=1)
 def get_ffmpeg_path():
     """
-    Get FFmpeg path. Try imageio-ffmpeg first, then fall back to system FFmpeg.
+    Get FFmpeg path. Use the cached imageio-ffmpeg path if still valid, otherwise
+    try imageio-ffmpeg first, then fall back to system FFmpeg.
     Returns the path or None if not found.
     """
+    # Reuse the bundled FFmpeg found on a previous run, unless the user picked one explicitly
+    if not os.environ.get('IMAGEIO_FFMPEG_EXE'):
+        try:
+            cached_path = _ffmpeg_cache_file().read_text(encoding='utf-8').strip()
+            if cached_path and os.path.isfile(cached_path):
+                print(f"[Info] Using cached FFmpeg from: {cached_path}")
+                return cached_path
+        except (OSError, RuntimeError):
+            pass
+    
     # Try imageio-ffmpeg first (bundled)
     try:
         import imageio_ffmpeg
         ffmpeg_path = imageio_ffmpeg.get_ffmpeg_exe()
         print(f"[Info] Using bundled FFmpeg from: {ffmpeg_path}")
+        if not os.environ.get('IMAGEIO_FFMPEG_EXE'):
+            _save_ffmpeg_cache(ffmpeg_path)
         return ffmpeg_path
     except ImportError:
         print("[Info] imageio-ffmpeg not installed, checking system FFmpeg...")
@@ -22,7 +60,6 @@ def get_ffmpeg_path():
     # Fall back to system FFmpeg
     system_ffmpeg = None
     try:
-        import shutil
         system_ffmpeg = shutil.which('ffmpeg')
         if system_ffmpeg:
             print(f"[Info] Using system FFmpeg from: {system_ffmpeg}")
@@ -36,6 +73,40 @@ def get_ffmpeg_path():
     print("Please install FFmpeg or run: pip install imageio-ffmpeg\n")
     return None
 
+# Remote URLs in BaseURL, media/initialization/sourceURL attributes and SegmentURL tags,
+# matched together so the manifest is scanned only once
+MEDIA_URL_RE = re.compile(
+    rb'<BaseURL[^>]*>(?P<base>https?://[^<]+)</BaseURL>'
+    rb'|media="(?P<media>https?://[^"]+)"'
+    rb'|initialization="(?P<initialization>https?://[^"]+)"'
+    rb'|sourceURL="(?P<sourceURL>https?://[^"]+)"'
+    rb'|<SegmentURL[^>]*>(?P<segment>https?://[^<]+)</SegmentURL>',
+    re.IGNORECASE
+)
+
+# Order in which media URL kinds are preferred when there is no BaseURL
+MEDIA_URL_PRIORITY = ('media', 'initialization', 'sourceURL', 'segment')
+
+def find_remote_url(mpd_data):
+    """
+    Find the remote URL referenced by raw MPD bytes (or an mmap).
+    A BaseURL is preferred, otherwise the first media URL of the highest-priority kind
+    in MEDIA_URL_PRIORITY is used (w3.org schema URLs are ignored).
+    Returns a (url, is_base_url) tuple, or (None, False) if nothing usable is found.
+    """
+    found = {}
+    for match in MEDIA_URL_RE.finditer(mpd_data):
+        if match.lastgroup == 'base':
+            return match.group('base').strip().decode('utf-8', 'replace'), True
+        potential_url = match.group(match.lastgroup).strip()
+        if match.lastgroup not in found and b'w3.org' not in potential_url:
+            found[match.lastgroup] = potential_url
+    
+    for kind in MEDIA_URL_PRIORITY:
+        if kind in found:
+            return found[kind].decode('utf-8', 'replace'), False
+    return None, False
+
 def progress_hook(d):
     """Progress hook to display download status."""
     if d['status'] == 'downloading':
@@ -47,6 +118,22 @@ def progress_hook(d):
     elif d['status'] == 'finished':
         print("\n[Finished] Download complete. Processing/Merging...")
 
+def path_to_file_uri(path):
+    """
+    Convert an absolute local path to a file:// URI with plain string formatting.
+    Matches pathlib.Path(path).as_uri() without building a Path object.
+    """
+    if os.name == 'nt':
+        path = path.replace('\\', '/')
+        if path[1:2] == ':':
+            # Drive letter path, e.g. C:/videos -> file:///C:/videos
+            return 'file:///' + path[:2] + quote(os.fsencode(path[2:]))
+        if path.startswith('//'):
+            # UNC path, e.g. //server/share -> file://server/share
+            return 'file:' + quote(os.fsencode(path))
+    # os.fsencode keeps undecodable (surrogate-escaped) bytes, as as_uri() does
+    return 'file://' + quote(os.fsencode(path))
+
 def validate_and_prepare_url(user_input):
     """
     Validate user input and prepare the URL.
@@ -61,18 +148,95 @@ def validate_and_prepare_url(user_input):
     if not cleaned_input:
         raise ValueError("Input cannot be empty after cleaning")
     
+    # Obvious remote URLs don't need a filesystem check
+    if cleaned_input[:8].lower().startswith(('http://', 'https://')):
+        return cleaned_input
+    
     # Check if it's a local file
     if os.path.isfile(cleaned_input):
         print(f"\n[Info] Detected local file: {cleaned_input}")
         # Convert to file URI - required by yt-dlp
         abs_path = os.path.abspath(cleaned_input)
-        file_uri = pathlib.Path(abs_path).as_uri()
+        file_uri = path_to_file_uri(abs_path)
         print(f"[Info] Converted to URI: {file_uri}")
         return str(file_uri)  # Return file:// URI as string
     else:
         # Assume it's a URL
         return str(cleaned_input)  # Ensure it's a string
 
+class _SilentLogger:
+    """yt-dlp logger that discards all messages (used while prewarming)."""
+    def debug(self, msg):
+        pass
+    
+    warning = error = debug
+
+def prewarm_connection(ydl, url):
+    """
+    Start a background metadata request for a remote URL on the given YoutubeDL
+    instance, so DNS, TLS and the connection pool are warm when the download starts.
+    The result is discarded: the download extracts again through ydl.download(), which
+    reports warnings and errors normally. Returns the started thread.
+    """
+    # Keep the background request from printing over the filename prompt
+    ydl.params['logger'] = _SilentLogger()
+    
+    def worker():
+        try:
+            ydl.extract_info(url, download=False, process=False)
+        except Exception:
+            pass
+        finally:
+            ydl.params.pop('logger', None)
+    
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    return thread
+
+def prompt_output_name():
+    """Ask for the output filename, defaulting to output.mp4 and adding .mp4 if missing."""
+    output_name = input("Enter the desired output filename (e.g., video.mp4): ").strip()
+    if not output_name:
+        output_name = "output.mp4"
+        print(f"[Info] No filename provided. Defaulting to '{output_name}'")
+    
+    if not output_name.lower().endswith('.mp4'):
+        output_name += ".mp4"
+    return output_name
+
+def download_remote(url, ydl_opts):
+    """
+    Download a remote URL with yt-dlp. The downloader is created before asking for the
+    output filename so its connection warms up while the user types.
+    """
+    try:
+        ydl = yt_dlp.YoutubeDL(ydl_opts)
+    except Exception as e:
+        print(f"\n[Error] An unexpected error occurred: {e}")
+        traceback.print_exc()  # Print full traceback for debugging
+        return
+    
+    with ydl:
+        prewarm_thread = prewarm_connection(ydl, url)
+        output_name = prompt_output_name()
+        ydl.params['outtmpl']['default'] = output_name  # outtmpl is a dict once constructed
+        
+        print(f"\n[Info] Starting download for: {output_name}...")
+        print("[Info] Using yt-dlp to download from URL...")
+        
+        try:
+            # Wait for the prewarm so its silent logger is no longer installed
+            prewarm_thread.join()
+            # Ensure we're passing a list of strings
+            ydl.download([str(url)])
+            print(f"\n[Success] Successfully saved as '{output_name}'")
+        
+        except yt_dlp.utils.DownloadError as e:
+            print(f"\n[Error] Download failed: {e}")
+        except Exception as e:
+            print(f"\n[Error] An unexpected error occurred: {e}")
+            traceback.print_exc()  # Print full traceback for debugging
+
 def main():
     print("=== MPD to MP4 Downloader ===\n")
     
@@ -97,28 +261,17 @@ def main():
     
     print(f"[Info] Processing URL: {url[:100]}...")  # Show first 100 chars
     
-    # Get output filename
-    output_name = input("Enter the desired output filename (e.g., video.mp4): ").strip()
-    if not output_name:
-        output_name = "output.mp4"
-        print(f"[Info] No filename provided. Defaulting to '{output_name}'")
-    
-    if not output_name.lower().endswith('.mp4'):
-        output_name += ".mp4"
-    
     # Post-processor hook to handle Windows file locking
     def postprocessor_hook(d):
         """Hook to handle post-processing events."""
-        if d['status'] == 'finished':
+        if d['status'] == 'finished' and os.name == 'nt':
             # Give Windows a moment to release file handles
-            import time
             time.sleep(0.5)
     
     # Configure yt-dlp options
     ydl_opts = {
         'format': 'bestvideo+bestaudio/best',  # Download best video and audio
         'merge_output_format': 'mp4',          # Merge into mp4
-        'outtmpl': output_name,                # Output filename template
         'progress_hooks': [progress_hook],     # Custom progress hook
         'postprocessor_hooks': [postprocessor_hook],  # Post-processor hook for file handling
         'quiet': True,                         # Suppress default output to use our hook
@@ -127,12 +280,17 @@ def main():
         'verbose': False,                      # Disable verbose for cleaner output
     }
     
+    # Download DASH fragments in parallel (same as yt-dlp's -N flag)
+    try:
+        ydl_opts['concurrent_fragment_downloads'] = max(1, int(os.environ.get('MPD2MP4_N', 8)))
+    except ValueError:
+        print("[Warning] Invalid MPD2MP4_N value, using 8 concurrent fragment downloads")
+        ydl_opts['concurrent_fragment_downloads'] = 8
+    
     # For local files, set the base URL to help resolve relative fragment paths
     if url.startswith('file://'):
-        # Extract directory from file path for base URL
-        local_path = url.replace('file:///', '').replace('file://', '')
-        base_dir = os.path.dirname(local_path)
-        base_url = pathlib.Path(base_dir).as_uri() + '/'
+        # The directory URL is the file URI up to and including its last slash
+        base_url = url.rsplit('/', 1)[0] + '/'
         print(f"[Info] Setting base URL for fragments: {base_url}")
         ydl_opts['http_headers'] = {'Referer': base_url}
     
@@ -140,12 +298,14 @@ def main():
     if ffmpeg_path:
         ydl_opts['ffmpeg_location'] = ffmpeg_path
     
-    print(f"\n[Info] Starting download for: {output_name}...")
-    
     # Use different methods for local files vs URLs
     is_local_file = url.startswith('file://')
     
     if is_local_file:
+        output_name = prompt_output_name()
+        ydl_opts['outtmpl'] = output_name
+        print(f"\n[Info] Starting download for: {output_name}...")
+        
         # For local MPD files, use ffmpeg directly (more reliable)
         print("[Info] Using FFmpeg to process local MPD file...")
         
@@ -154,10 +314,8 @@ def main():
             return
         
         # Convert file:// URI back to local path
-        local_path = url.replace('file:///', '').replace('file://', '')
-        # Handle Windows paths
-        if os.name == 'nt' and local_path.startswith('/'):
-            local_path = local_path[1:]  # Remove leading slash on Windows
+        # (url2pathname also decodes %XX escapes and handles Windows drive letters)
+        local_path = url2pathname(urlparse(url).path)
         
         # Get the directory containing the MPD file
         mpd_dir = os.path.dirname(os.path.abspath(local_path))
@@ -170,16 +328,21 @@ def main():
         print(f"[Info] MPD filename: {mpd_filename}")
         
         # Diagnostic: List files in the MPD directory
-        print(f"\n[Diagnostic] Files in {mpd_dir}:")
+        # Collect the listing and write it in one go instead of one print per entry
+        lines = [f"\n[Diagnostic] Files in {mpd_dir}:"]
         try:
-            for item in os.listdir(mpd_dir)[:20]:  # Show first 20 items
-                item_path = os.path.join(mpd_dir, item)
-                if os.path.isdir(item_path):
-                    print(f"  [DIR]  {item}/")
-                else:
-                    print(f"  [FILE] {item}")
+            # scandir reuses the file type from the directory listing (no stat per entry)
+            with os.scandir(mpd_dir) as entries:
+                for i, entry in enumerate(entries):
+                    if i >= 20:  # Show first 20 items
+                        break
+                    if entry.is_dir():
+                        lines.append(f"  [DIR]  {entry.name}/")
+                    else:
+                        lines.append(f"  [FILE] {entry.name}")
         except Exception as e:
-            print(f"  Error listing directory: {e}")
+            lines.append(f"  Error listing directory: {e}")
+        sys.stdout.write('\n'.join(lines) + '\n')
         
         # Check if MPD file exists and is readable
         mpd_full_path = os.path.join(mpd_dir, mpd_filename)
@@ -188,56 +351,37 @@ def main():
             return
         
         print(f"\n[Info] MPD file exists and is accessible")
-        print(f"[Info] MPD file size: {os.path.getsize(mpd_full_path)} bytes")
+        mpd_size = os.path.getsize(mpd_full_path)
+        print(f"[Info] MPD file size: {mpd_size} bytes")
         
         # Read and inspect MPD file to check for remote URLs
         print(f"\n[Info] Inspecting MPD file content...")
         try:
-            with open(mpd_full_path, 'r', encoding='utf-8') as f:
-                mpd_content = f.read()
-            
-            # Check if MPD contains HTTP/HTTPS URLs
-            has_remote_urls = 'http://' in mpd_content or 'https://' in mpd_content
+            # Map the file instead of reading and decoding it into a str
+            has_remote_urls = False
+            remote_url, is_base_url = None, False
+            if mpd_size:
+                with open(mpd_full_path, 'rb') as f, \
+                        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    # Check if MPD contains HTTP/HTTPS URLs
+                    has_remote_urls = mm.find(b'http://') != -1 or mm.find(b'https://') != -1
+                    if has_remote_urls:
+                        remote_url, is_base_url = find_remote_url(mm)
             
             if has_remote_urls:
                 print("[Info] MPD file contains remote URLs (http/https)")
                 print("[Info] This MPD references online content, not local files")
                 print("[Info] Switching to yt-dlp to download from the remote source...")
                 
-                # Extract base URL from MPD if possible
-                import re
-                
-                # Try to find BaseURL tag first
-                base_url_match = re.search(r'<BaseURL[^>]*>(https?://[^<]+)</BaseURL>', mpd_content, re.IGNORECASE)
-                if base_url_match:
-                    remote_url = base_url_match.group(1).strip()
+                if is_base_url:
                     print(f"[Info] Found BaseURL in MPD: {remote_url}")
+                elif remote_url:
+                    print(f"[Info] Found media URL in MPD: {remote_url}")
                 else:
-                    # Look for media URLs (ignore w3.org schema URLs)
-                    # Try to find URLs in media/initialization/segment tags
-                    media_patterns = [
-                        r'media="(https?://[^"]+)"',
-                        r'initialization="(https?://[^"]+)"',
-                        r'sourceURL="(https?://[^"]+)"',
-                        r'<SegmentURL[^>]*>(https?://[^<]+)</SegmentURL>',
-                    ]
-                    
-                    remote_url = None
-                    for pattern in media_patterns:
-                        url_match = re.search(pattern, mpd_content, re.IGNORECASE)
-                        if url_match:
-                            potential_url = url_match.group(1).strip()
-                            # Skip w3.org URLs (XML schemas)
-                            if 'w3.org' not in potential_url:
-                                remote_url = potential_url
-                                print(f"[Info] Found media URL in MPD: {remote_url}")
-                                break
-                    
-                    if not remote_url:
-                        print("[Warning] Could not extract a valid media URL from MPD")
-                        print("[Info] The MPD might use relative paths with a remote base")
-                        print("[Tip] Please provide the original URL where you downloaded this MPD from")
-                        return
+                    print("[Warning] Could not extract a valid media URL from MPD")
+                    print("[Info] The MPD might use relative paths with a remote base")
+                    print("[Tip] Please provide the original URL where you downloaded this MPD from")
+                    return
                 
                 # Use yt-dlp for remote content
                 print(f"\n[Info] Using yt-dlp to download from remote source...")
@@ -247,7 +391,6 @@ def main():
                     print(f"\n[Success] Successfully saved as '{output_name}'")
                 except Exception as e:
                     print(f"\n[Error] yt-dlp failed: {e}")
-                    import traceback
                     traceback.print_exc()
                 return
             else:
@@ -259,16 +402,16 @@ def main():
             print(f"[Warning] Could not read MPD file: {e}")
         
         try:
-            import subprocess
-            
             # Use ffmpeg to convert MPD to MP4
             # Run from the MPD directory so relative paths work
             cmd = [
                 ffmpeg_path,
                 '-protocol_whitelist', 'file,http,https,tcp,tls,crypto',  # Allow file protocol
                 '-allowed_extensions', 'ALL',  # Allow all file extensions (including .webp)
+                '-fflags', '+genpts',          # Regenerate missing timestamps
                 '-i', mpd_filename,            # Input MPD file (relative to working dir)
                 '-c', 'copy',                  # Copy streams without re-encoding (faster)
+                '-movflags', '+faststart',     # Put moov atom first for streamable output
                 '-y',                          # Overwrite output file
                 output_abs                     # Output file (absolute path)
             ]
@@ -276,53 +419,59 @@ def main():
             print(f"[Info] Running FFmpeg from directory: {mpd_dir}")
             print(f"[Debug] Command: {' '.join(cmd)}")
             
-            # Run with real-time output from the MPD directory
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,  # Combine stderr with stdout
-                text=True,
-                bufsize=1,
-                universal_newlines=True,
-                cwd=mpd_dir  # Change working directory to MPD location
-            )
-            
-            # Print output in real-time
-            print("\n--- FFmpeg Output ---")
-            for line in process.stdout:
-                print(line.rstrip())
-            
-            process.wait()
-            print("--- End FFmpeg Output ---\n")
+            if os.environ.get('MPD2MP4_QUIET', '') not in ('', '0'):
+                # Quiet mode: let FFmpeg write straight to a temp log, shown only on failure
+                with tempfile.TemporaryFile() as log:
+                    returncode = subprocess.call(
+                        cmd,
+                        stdout=log,
+                        stderr=subprocess.STDOUT,  # Combine stderr with stdout
+                        cwd=mpd_dir  # Change working directory to MPD location
+                    )
+                    if returncode != 0:
+                        print("\n--- FFmpeg Output ---")
+                        sys.stdout.flush()
+                        log.seek(0)
+                        shutil.copyfileobj(log, sys.stdout.buffer)
+                        sys.stdout.buffer.flush()
+                        print("\n--- End FFmpeg Output ---\n")
+            else:
+                # Run with real-time output from the MPD directory
+                process = subprocess.Popen(
+                    cmd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,  # Combine stderr with stdout
+                    bufsize=65536,             # Read FFmpeg output in large binary blocks
+                    cwd=mpd_dir  # Change working directory to MPD location
+                )
+                
+                # Print output in real-time, passing raw blocks straight through
+                print("\n--- FFmpeg Output ---")
+                sys.stdout.flush()
+                while True:
+                    chunk = process.stdout.read1(65536)  # Returns whatever is available
+                    if not chunk:
+                        break
+                    sys.stdout.buffer.write(chunk)
+                    sys.stdout.buffer.flush()
+                
+                returncode = process.wait()
+                print("\n--- End FFmpeg Output ---\n")
             
-            if process.returncode == 0:
+            if returncode == 0:
                 print(f"[Success] Successfully saved as '{output_name}'")
             else:
-                print(f"[Error] FFmpeg failed with return code {process.returncode}")
+                print(f"[Error] FFmpeg failed with return code {returncode}")
                 print("[Tip] The MPD file might reference fragments that don't exist locally,")
                 print("      or the file paths in the manifest might be incorrect.")
         
         except Exception as e:
             print(f"\n[Error] Failed to process with FFmpeg: {e}")
-            import traceback
             traceback.print_exc()
     
     else:
         # For remote URLs, use yt-dlp
-        print("[Info] Using yt-dlp to download from URL...")
-        
-        try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                # Ensure we're passing a list of strings
-                ydl.download([str(url)])
-            print(f"\n[Success] Successfully saved as '{output_name}'")
-        
-        except yt_dlp.utils.DownloadError as e:
-            print(f"\n[Error] Download failed: {e}")
-        except Exception as e:
-            print(f"\n[Error] An unexpected error occurred: {e}")
-            import traceback
-            traceback.print_exc()  # Print full traceback for debugging
+        download_remote(url, ydl_opts)
 
 if __name__ == "__main__":
     main()